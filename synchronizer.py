@@ -1,10 +1,64 @@
 
 import argparse
+import collections
+import errno
+import functools
 import os
 import shutil
+import sys
 import hashlib
+import sqlite3
 import time
 import logging
+import logging.handlers
+import queue
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+try:
+    import blake3
+except ImportError:
+    blake3 = None
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+try:
+    from watchdog.observers import Observer
+except ImportError:
+    Observer = None
+
+if sys.platform.startswith("linux"):
+    import fcntl
+
+# clonefile(2) is only available on macOS.
+clonefile = None
+if sys.platform == "darwin":
+    import ctypes
+    clonefile = getattr(ctypes.CDLL(None, use_errno=True), "clonefile", None)
+    if clonefile is not None:
+        clonefile.argtypes = [ctypes.c_char_p, ctypes.c_char_p, ctypes.c_uint32]
+        clonefile.restype = ctypes.c_int
+
+# ioctl request cloning a whole file on Linux (_IOW(0x94, 9, int)).
+FICLONE = 0x40049409
+
+# Size of blocks read from disk when hashing or comparing files.
+CHUNK_SIZE = 1024 * 1024
+
+# Number of log records buffered before they are written to the log file.
+LOG_BATCH_SIZE = 1024
+
+# Maximum number of files queued for checking or copying ahead of the walk.
+PIPELINE_DEPTH = 256
+
+# Non-cryptographic hashes usable for change detection, provided by optional packages.
+FAST_ALGORITHMS = {
+    "blake3": blake3 and blake3.blake3,
+    "xxh3": xxhash and xxhash.xxh3_128,
+}
 
 
 class Synchronizer:
@@ -14,27 +68,199 @@ class Synchronizer:
     Changes in replica are not reflected in source.
     """
 
-    def __init__(self, source, replica, logfile, interval, algorithm="md5"):
+    def __init__(self, source, replica, logfile, interval, algorithm="md5", workers=None):
         self.source = source
         self.replica = replica
         self.logfile = logfile
         self.interval = interval
+        self.workers = workers or (os.cpu_count() or 1) * 2 # Threads used for hashing and copying
         self.algorithm = algorithm.lower() # Ensure algorithm name is lowercase
+        self.cachefile = f"{logfile}.cache.db"
 
-        if self.algorithm not in hashlib.algorithms_available:
+        if self.algorithm not in hashlib.algorithms_available | FAST_ALGORITHMS.keys():
             logging.error(f"Chosen algorithm {self.algorithm} not available")
             raise ValueError(f"Invalid checksum algorithm: {self.algorithm}")
+        if self.algorithm in FAST_ALGORITHMS and FAST_ALGORITHMS[self.algorithm] is None:
+            logging.error(f"Chosen algorithm {self.algorithm} requires an optional package that is not installed")
+            raise ValueError(f"Checksum algorithm {self.algorithm} is not installed")
+        self.new_hash = self.get_hash_constructor()
+
+        # Checksums of replica files keyed by path: {path: (size, mtime_ns, checksum)}
+        self.checksum_cache = {}
+        # Set when a source folder could not be read during the current synchronization.
+        self.read_failed = False
+        # Paths whose cache entry changed since the cache was last saved.
+        self.changed_checksums = set()
+        # Replica directories deleted since the cache was last saved.
+        self.deleted_dirs = set()
+        self.cache_db = self.open_checksum_cache()
+
+    def open_checksum_cache(self):
+        """Opens the sqlite database with replica checksums persisted by previous runs
+        and loads the entries recorded with the chosen algorithm.
+
+        Returns:
+            The database connection, or None if the cache file cannot be used.
+        """
+        try:
+            db = sqlite3.connect(self.cachefile)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("""CREATE TABLE IF NOT EXISTS checksums (
+                              path TEXT PRIMARY KEY, algorithm TEXT,
+                              size INTEGER, mtime INTEGER, digest TEXT)""")
+            rows = db.execute("SELECT path, size, mtime, digest FROM checksums WHERE algorithm = ?",
+                              (self.algorithm,))
+            self.checksum_cache = {path: (size, mtime, digest) for path, size, mtime, digest in rows}
+        except sqlite3.Error as e:
+            logging.warning(f"Could not open checksum cache {self.cachefile}: {e}")
+            return None
+        return db
+
+    def save_checksum_cache(self):
+        """Writes the cache entries changed during the last synchronization to the database."""
+        if self.cache_db is None:
+            return
+        changed, self.changed_checksums = self.changed_checksums, set()
+        deleted_dirs, self.deleted_dirs = self.deleted_dirs, set()
+        upserts, deletes = [], []
+        for path in changed:
+            cached = self.checksum_cache.get(path)
+            if cached is None:
+                deletes.append((path,))
+            else:
+                upserts.append((path, self.algorithm, *cached))
+        # Range over the primary key, matching all paths below each directory.
+        ranges = [(os.path.join(path, ""), path + chr(ord(os.sep) + 1)) for path in deleted_dirs]
+        try:
+            with self.cache_db:
+                self.cache_db.executemany("DELETE FROM checksums WHERE path = ?", deletes)
+                self.cache_db.executemany("DELETE FROM checksums WHERE path >= ? AND path < ?",
+                                          ranges)
+                self.cache_db.executemany("INSERT OR REPLACE INTO checksums VALUES (?, ?, ?, ?, ?)",
+                                          upserts)
+        except sqlite3.Error as e:
+            logging.warning(f"Could not save checksum cache {self.cachefile}: {e}")
+
+    def cache_checksum(self, replica_file, replica_stat, checksum):
+        """Records the checksum of a replica file together with its size and mtime."""
+        self.checksum_cache[replica_file] = (replica_stat.st_size, replica_stat.st_mtime_ns, checksum)
+        self.changed_checksums.add(replica_file)
+
+    def forget_checksum(self, replica_file):
+        """Drops the cached checksum of a replica file."""
+        if self.checksum_cache.pop(replica_file, None) is not None:
+            self.changed_checksums.add(replica_file)
+
+    def forget_directory_checksums(self, replica_dir):
+        """Drops the cached checksums of all files below a replica directory
+        that is about to be deleted.
+
+        Args:
+            replica_dir: Path to the directory in the replica.
+        """
+        for root, _, files in os.walk(replica_dir):
+            for file in files:
+                self.forget_checksum(os.path.join(root, file))
+        self.deleted_dirs.add(replica_dir)
+
+    def get_cached_checksum(self, replica_file, replica_stat):
+        """Returns the cached checksum of a replica file if the file has not
+        been modified since it was recorded, None otherwise.
+
+        Args:
+            replica_file: Path to the file in the replica.
+            replica_stat: Result of os.stat on the replica file.
+        """
+        cached = self.checksum_cache.get(replica_file)
+        if cached and cached[:2] == (replica_stat.st_size, replica_stat.st_mtime_ns):
+            return cached[2]
+        return None
+
+    def get_hash_constructor(self):
+        """Returns a callable creating new hash objects for the chosen algorithm.
+
+        It is resolved once, so hashing a file does not look the algorithm up again.
+        """
+        if self.algorithm in FAST_ALGORITHMS:
+            return FAST_ALGORITHMS[self.algorithm]
+        # Named constructors such as hashlib.md5 skip the name dispatch of hashlib.new.
+        constructor = getattr(hashlib, self.algorithm, None)
+        if constructor is None:
+            constructor = functools.partial(hashlib.new, self.algorithm)
+        # Checksums only detect changes. Without this flag, hashlib raises
+        # ValueError for md5 and other non-approved algorithms under FIPS-mode OpenSSL.
+        return functools.partial(constructor, usedforsecurity=False)
+
+    def advise_sequential(self, f):
+        """Tells the kernel that a file will be read sequentially, so it reads
+        ahead aggressively while the blocks are processed. No-op where
+        posix_fadvise is not available.
+
+        Args:
+            f: File object opened for reading.
+        """
+        if hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+
+    def compare_files(self, source_file, replica_file):
+        """Compares two files chunk by chunk, stopping at the first difference.
+
+        The source chunks are hashed on the way, so a match also yields the
+        checksum of the content for the cache.
+
+        Args:
+            source_file: Path to the source file.
+            replica_file: Path to the corresponding file in the replica.
+
+        Returns:
+            Checksum of the content if the files are equal, None otherwise.
+        """
+        h = self.new_hash()
+        with open(source_file, 'rb') as fsrc, open(replica_file, 'rb') as frep:
+            self.advise_sequential(fsrc)
+            self.advise_sequential(frep)
+            while True:
+                chunk = fsrc.read(CHUNK_SIZE)
+                if chunk != frep.read(CHUNK_SIZE):
+                    return None
+                if not chunk:
+                    return h.hexdigest()
+                h.update(chunk)
 
     def get_checksum(self, filepath):
         """ Calculates a checksum of a file using the specified algorithm.
 
+        Files smaller than CHUNK_SIZE are read and hashed in one go. Larger
+        files are read into a reused buffer block by block. They are not
+        memory-mapped: source files may be truncated while they are hashed,
+        and touching a truncated mapping kills the process with SIGBUS.
+
         Args:
             filepath: Path to the file for which is checksum created.
         """
-        with open(filepath, 'rb') as f:
-            data = f.read()
-            return getattr(hashlib, self.algorithm)(data).hexdigest()
-    
+        h = self.new_hash()
+        with open(filepath, 'rb', buffering=0) as f:
+            if os.fstat(f.fileno()).st_size >= CHUNK_SIZE:
+                self.advise_sequential(f)
+                buffer = bytearray(CHUNK_SIZE)
+                view = memoryview(buffer)
+                while size := f.readinto(buffer):
+                    h.update(view[:size])
+            else:
+                h.update(f.read())
+        return h.hexdigest()
+
+    def get_replica_dir(self, source_dir):
+        """Returns the replica directory corresponding to a source directory.
+
+        The path is normalized, so the cache keys of files below it are the
+        same however the directory was reached.
+
+        Args:
+            source_dir: Path to the directory in the source.
+        """
+        return os.path.normpath(os.path.join(self.replica, os.path.relpath(source_dir, self.source)))
+
     def create_replica_folder(self, source_dir, replica_dir):
         """Creates the folder structure in the replica based on the source directory.
 
@@ -49,47 +275,252 @@ class Synchronizer:
 
         Args:
             replica_dir: Path to the directory in the replica.
-            items: List of files and directories in the source directory.
+            items: Set of names of files and directories in the source directory.
+
+        Returns:
+            Dictionary of the remaining replica entries, {name: os.DirEntry}.
         """
-        for item in os.listdir(replica_dir):
-            replica_item = os.path.join(replica_dir, item)
-            if os.path.isfile(replica_item) and item not in items:
-                os.remove(replica_item)
-                logging.info(f"Deleted: {replica_item}")
-            elif os.path.isdir(replica_item) and item not in items:
-                shutil.rmtree(replica_item)
-                logging.info(f"Deleted: {replica_dir}")
+        existing = {}
+        extra = []
+        with os.scandir(replica_dir) as entries:
+            for entry in entries:
+                if entry.name in items:
+                    existing[entry.name] = entry
+                else:
+                    extra.append(entry)
+        for entry in extra:
+            if entry.is_dir(follow_symlinks=False):
+                self.forget_directory_checksums(entry.path)
+                shutil.rmtree(entry.path)
+            else:
+                os.remove(entry.path)
+                self.forget_checksum(entry.path)
+            logging.info(f"Deleted: {entry.path}")
+        return existing
 
-    def copy_missing_files(self, source_dir, replica_dir, files):
-        """Copies files from the source directory to the replica if they are missing.
+    def walk_source(self, source_dir, recursive=True):
+        """Walks the source tree top-down, like os.walk, using os.scandir.
+
+        The file type is taken from the directory listing, so no extra stat
+        call is needed per entry. Symbolic links to directories are listed
+        but not followed. On POSIX systems files are listed in inode order,
+        which roughly follows their placement on disk, so processing them in
+        that order reduces seeking.
+        Folders that cannot be read are logged, skipped and make the current
+        synchronization report failure.
 
         Args:
-            source_dir: Path to the source directory.
-            replica_dir: Path to the corresponding directory in the replica.
-            files: List of files in the source directory.
+            source_dir: Path to the directory in the source to start from.
+            recursive: Whether to descend into subdirectories.
+
+        Yields:
+            Tuples (directory, subdirectory names, file names).
         """
-        for file in files:
-            source_file = os.path.join(source_dir, file)
-            replica_file = os.path.join(replica_dir, file)
-            if not os.path.exists(replica_file):
-                shutil.copy(source_file, replica_file)
-                logging.info(f"Created: {replica_file}")
+        dirs, files, subdirs = [], [], []
+        try:
+            with os.scandir(source_dir) as entries:
+                for entry in entries:
+                    if entry.is_dir():
+                        dirs.append(entry.name)
+                        if not entry.is_symlink():
+                            subdirs.append(entry.path)
+                    else:
+                        files.append(entry)
+        except OSError as e:
+            logging.error(f"Cannot read {source_dir}: {e}")
+            # The rest of the tree is still synchronized, but the pass counts as failed.
+            self.read_failed = True
+            return
+        if os.name == "posix":
+            # The inode number comes with the directory listing, no stat is needed.
+            files.sort(key=os.DirEntry.inode)
+        files = [entry.name for entry in files]
+        yield source_dir, dirs, files
+        if recursive:
+            for subdir in subdirs:
+                yield from self.walk_source(subdir)
+
+    def walk_changed(self, source_dirs):
+        """Walks only the given source directories, without their subdirectories,
+        except for subdirectories that do not exist in the replica yet.
 
-    def update_changed_files(self, source_file, replica_file):
-        """Checks if the source file has changed and updates the replica if needed.
+        Every directory is walked at most once. A second walk would see files
+        that are still being copied as changed and copy them again.
+
+        Args:
+            source_dirs: Paths of changed directories in the source.
+
+        Yields:
+            Tuples (directory, subdirectory names, file names), like walk_source.
+        """
+        walked = set()
+        walked_trees = []
+        # Sorted, so parents come before their subdirectories.
+        for source_dir in sorted(map(os.path.normpath, source_dirs)):
+            if source_dir in walked or any(
+                    source_dir.startswith(os.path.join(tree, "")) for tree in walked_trees):
+                continue
+            walked.add(source_dir)
+            relpath = os.path.relpath(source_dir, self.source)
+            if relpath == os.pardir or relpath.startswith(os.pardir + os.sep):
+                logging.warning(f"Skipped {source_dir}: not inside {self.source}")
+                continue
+            if not os.path.isdir(source_dir):
+                # Deleted since the change was seen; its parent is synchronized instead.
+                continue
+            for root, dirs, files in self.walk_source(source_dir, recursive=False):
+                yield root, dirs, files
+                replica_dir = self.get_replica_dir(root)
+                for subdir in dirs:
+                    source_subdir = os.path.join(root, subdir)
+                    if (not os.path.isdir(os.path.join(replica_dir, subdir))
+                            and not os.path.islink(source_subdir)):
+                        walked.add(source_subdir)
+                        walked_trees.append(source_subdir)
+                        yield from self.walk_source(source_subdir)
+
+    def copy_file(self, source_file, replica_file):
+        """Copies content and metadata of a file, like shutil.copy2.
+
+        The content is copied with the fastest method the platform and
+        filesystem support:
+            1. A copy-on-write clone (reflink) on btrfs, XFS and APFS, which
+               shares the data blocks instead of copying them.
+            2. os.copy_file_range on Linux, which copies inside the kernel.
+            3. shutil.copyfile, which itself uses sendfile/fcopyfile where available.
+
+        Args:
+            source_file: Path to the source file.
+            replica_file: Path to the destination file in the replica.
+        """
+        for copy in (self.clone_file, self.copy_file_range):
+            try:
+                copy(source_file, replica_file)
+                break
+            except (AttributeError, OSError):
+                continue
+        else:
+            shutil.copyfile(source_file, replica_file)
+        shutil.copystat(source_file, replica_file)
+
+    def clone_file(self, source_file, replica_file):
+        """Creates the replica file as a copy-on-write clone of the source file,
+        with the FICLONE ioctl on Linux or clonefile on macOS.
+
+        Raises:
+            AttributeError: Cloning is not available on this platform.
+            OSError: The filesystem cannot clone between these files.
+        """
+        if clonefile is not None:
+            # clonefile creates the destination itself, so it must not exist yet.
+            if clonefile(os.fsencode(source_file), os.fsencode(replica_file), 0) != 0:
+                error = ctypes.get_errno()
+                raise OSError(error, os.strerror(error), replica_file)
+            return
+        if not sys.platform.startswith("linux"):
+            raise AttributeError("File cloning is not available on this platform")
+        with open(source_file, 'rb') as fsrc, open(replica_file, 'wb') as fdst:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+
+    def copy_file_range(self, source_file, replica_file):
+        """Copies the content of a file with os.copy_file_range.
+
+        Raises:
+            AttributeError: os.copy_file_range is not available on this platform.
+            OSError: The copy is not supported between these files.
+        """
+        copy_file_range = os.copy_file_range
+        with open(source_file, 'rb') as fsrc, open(replica_file, 'wb') as fdst:
+            size = remaining = os.fstat(fsrc.fileno()).st_size
+            while remaining > 0:
+                copied = copy_file_range(fsrc.fileno(), fdst.fileno(), remaining)
+                if copied == 0:
+                    if remaining == size:
+                        # Some kernels return 0 instead of failing, e.g. across filesystems.
+                        raise OSError(errno.ENOTSUP, "copy_file_range copied no data", replica_file)
+                    # The source was truncated while copying.
+                    break
+                remaining -= copied
+
+    def copy_missing_file(self, source_file, replica_file):
+        """Copies a file that is missing in the replica from the source.
 
         Args:
             source_file: Path to the source file.
             replica_file: Path to the corresponding file in the replica.
         """
-        source_checksum = self.get_checksum(source_file)
-        replica_checksum = self.get_checksum(replica_file)
-        if source_checksum != replica_checksum:
-            os.remove(replica_file)
-            shutil.copy(source_file, replica_file)
-            logging.info(f"""Updated: {source_file} -> {replica_file}""")
-    
-    def sync(self):
+        self.copy_file(source_file, replica_file)
+        logging.info(f"Created: {replica_file}")
+
+    def check_changed_file(self, source_file, replica_file, replica_stat=None):
+        """Checks if the source file has changed compared to its replica.
+
+        Files with matching size and modification time are considered unchanged
+        and are not read at all. Files of different size have changed without
+        reading them either. Files of equal size are compared against the cached
+        replica checksum, or chunk by chunk if there is none.
+
+        Args:
+            source_file: Path to the source file.
+            replica_file: Path to the corresponding file in the replica.
+            replica_stat: Result of os.stat on the replica file, if already known.
+
+        Returns:
+            Tuple (changed, source entry). The entry is (size, mtime_ns, checksum) of
+            the source as it was hashed, or None if no checksum was computed.
+        """
+        source_stat = os.stat(source_file)
+        if replica_stat is None:
+            replica_stat = os.stat(replica_file)
+        if source_stat.st_size != replica_stat.st_size:
+            return True, None
+        if source_stat.st_mtime_ns == replica_stat.st_mtime_ns:
+            return False, None
+
+        replica_checksum = self.get_cached_checksum(replica_file, replica_stat)
+        if replica_checksum is not None:
+            source_checksum = self.get_checksum(source_file)
+            if source_checksum != replica_checksum:
+                return True, (source_stat.st_size, source_stat.st_mtime_ns, source_checksum)
+        else:
+            source_checksum = self.compare_files(source_file, replica_file)
+            if source_checksum is None:
+                return True, None
+
+        # The source changed while it was read, the result is not valid for it.
+        new_stat = os.stat(source_file)
+        if (new_stat.st_size, new_stat.st_mtime_ns) != (source_stat.st_size, source_stat.st_mtime_ns):
+            return True, None
+
+        # Same content, only align timestamps so the next pass skips hashing.
+        shutil.copystat(source_file, replica_file)
+        replica_stat = os.stat(replica_file)
+        self.cache_checksum(replica_file, replica_stat, source_checksum)
+        return False, None
+
+    def update_changed_file(self, source_file, replica_file, source_entry=None):
+        """Replaces the replica file with the changed source file.
+
+        The checksum computed by check_changed_file is only cached if the copy
+        has the size and mtime the source had when it was hashed. Otherwise the
+        source changed in between and the checksum does not match the copy.
+
+        Args:
+            source_file: Path to the source file.
+            replica_file: Path to the corresponding file in the replica.
+            source_entry: (size, mtime_ns, checksum) of the source returned by
+                check_changed_file, if it computed one.
+        """
+        os.remove(replica_file)
+        self.copy_file(source_file, replica_file)
+        logging.info(f"""Updated: {source_file} -> {replica_file}""")
+        replica_stat = os.stat(replica_file)
+        if source_entry is None or source_entry[:2] != (replica_stat.st_size, replica_stat.st_mtime_ns):
+            self.forget_checksum(replica_file)
+            return
+        self.cache_checksum(replica_file, replica_stat, source_entry[2])
+
+    def sync(self, source_dirs=None):
         """
         Synchronizes replica folder and source folder.
 
@@ -98,24 +529,134 @@ class Synchronizer:
             2. Deletes any files or directories in the replica that are not present in the source.
             3. Copies any files missing from the replica from the source.
             4. Updates the replica if the source file has changed.
+
+        Steps 3 and 4 run as a pipeline while the source is still being walked:
+        files are checked on one thread pool and copied on another, so walking,
+        hashing and copying overlap.
+
+        Args:
+            source_dirs: Source directories known to have changed. If given, only
+                these directories are synchronized instead of the whole tree.
+
+        Returns:
+            True if the synchronization completed, False if it failed.
         """
         logging.info(f"Synchronization started")
+        self.read_failed = False
         try:
-            for root, dirs, files in os.walk(self.source):
-                    replica_dir = os.path.join(self.replica, os.path.relpath(root, self.source))
-                    self.create_replica_folder(root, replica_dir)
-                    self.delete_extra_replica_items(replica_dir, items=dirs + files)
-                    self.copy_missing_files(root, replica_dir, files)
-                    # Update modified files
-                    for file in files:
-                        source_file = os.path.join(root, file)
-                        replica_file = os.path.join(replica_dir, file)
-                        self.update_changed_files(source_file, replica_file)
+            with ThreadPoolExecutor(max_workers=self.workers) as copy_executor, \
+                    ThreadPoolExecutor(max_workers=self.workers) as check_executor:
+                pending = collections.deque()
+
+                def check_file(source_file, replica_file, replica_entry):
+                    changed, source_entry = self.check_changed_file(source_file, replica_file,
+                                                                    replica_entry.stat())
+                    if changed:
+                        return copy_executor.submit(self.update_changed_file,
+                                                    source_file, replica_file, source_entry)
+                    return None
+
+                def wait_pending(limit):
+                    # Results are awaited in submission order, which raises the first
+                    # error and keeps the walk at most `limit` files ahead of the workers.
+                    while len(pending) > limit:
+                        result = pending.popleft().result()
+                        if isinstance(result, Future):
+                            pending.append(result)
+
+                if source_dirs is None:
+                    walk = self.walk_source(self.source)
+                else:
+                    walk = self.walk_changed(source_dirs)
+                for root, dirs, files in walk:
+                        replica_dir = self.get_replica_dir(root)
+                        self.create_replica_folder(root, replica_dir)
+                        existing = self.delete_extra_replica_items(replica_dir, items=set(dirs) | set(files))
+                        for file in files:
+                            source_file = os.path.join(root, file)
+                            replica_file = os.path.join(replica_dir, file)
+                            if file in existing:
+                                pending.append(check_executor.submit(
+                                    check_file, source_file, replica_file, existing[file]))
+                            else:
+                                pending.append(copy_executor.submit(
+                                    self.copy_missing_file, source_file, replica_file))
+                            wait_pending(PIPELINE_DEPTH)
+                wait_pending(0)
 
+            self.save_checksum_cache()
+            if self.read_failed:
+                logging.error(f"Synchronization incomplete: some source folders could not be read")
+                return False
             logging.info(f"Synchronization completed. Sleeping for {self.interval} seconds.")
+            return True
 
         except Exception as e:
                 logging.error(f"Synchronization failed: {e}")
+                return False
+
+
+class ChangedDirectories:
+    """
+    Collects source directories with changes reported by a watchdog observer.
+    Works as a watchdog event handler.
+    """
+
+    def __init__(self, source):
+        self.source = source
+        self.root = os.path.realpath(source)
+        self.lock = threading.Lock()
+        self.dirs = set()
+
+    def get_source_dir(self, path):
+        """Maps a directory reported by the observer to the source directory.
+
+        Args:
+            path: Path of the directory as reported in an event.
+
+        Returns:
+            The directory below the source path given to the synchronizer,
+            or None if the path is outside the source.
+        """
+        relpath = os.path.relpath(os.path.realpath(path), self.root)
+        if relpath == os.pardir or relpath.startswith(os.pardir + os.sep):
+            return None
+        return os.path.normpath(os.path.join(self.source, relpath))
+
+    def dispatch(self, event):
+        """Records the directories affected by a file system event.
+
+        Args:
+            event: watchdog file system event.
+        """
+        if event.event_type in ("opened", "closed_no_write"):
+            # Reads do not change anything, including the synchronizer's own reads.
+            return
+        dirs = []
+        for path in filter(None, [event.src_path, getattr(event, "dest_path", "")]):
+            path = os.fsdecode(path)
+            if event.is_directory:
+                dirs.append(path)
+            # The parent of the source root is outside the source and is dropped below.
+            dirs.append(os.path.dirname(path))
+        source_dirs = {self.get_source_dir(path) for path in dirs} - {None}
+        with self.lock:
+            self.dirs |= source_dirs
+
+    def drain(self):
+        """Returns the directories changed since the last call and resets them."""
+        with self.lock:
+            dirs, self.dirs = self.dirs, set()
+        return dirs
+
+    def add(self, dirs):
+        """Marks directories as changed again, e.g. after a failed synchronization.
+
+        Args:
+            dirs: Source directories returned by drain.
+        """
+        with self.lock:
+            self.dirs |= dirs
 
 
 def main():
@@ -129,23 +670,72 @@ def main():
     parser.add_argument("interval", default=300, type=int, 
                         help="Synchronization interval in seconds")
     parser.add_argument("algorithm", default="md5",
-                        help="Algorithm for comparison of checksums")
+                        help="Algorithm for comparison of checksums "
+                             "(any hashlib algorithm, or blake3/xxh3 if installed)")
+    parser.add_argument("--watch", action="store_true",
+                        help="Watch the source for changes and only synchronize "
+                             "changed folders between full runs (requires watchdog)")
+    parser.add_argument("--full-interval", default=3600, type=int,
+                        help="With --watch, seconds between full synchronizations, which "
+                             "repair changes made directly in the replica and changes "
+                             "missed by the watcher (default: 3600)")
     args = parser.parse_args()
+    if args.watch and Observer is None:
+        parser.error("--watch requires the watchdog package")
     
     # Initialization of Synchronizer.
     sync = Synchronizer(args.source, args.replica, args.logfile, 
                         args.interval, args.algorithm)
 
     #Configuration of logging.
-    logging.basicConfig(filename=args.logfile, 
-                        format='%(asctime)s %(levelname)s %(message)s', 
-                        datefmt='%Y-%m-%d %H:%M:%S',
+    # Records are queued by the synchronizing threads and written to the file
+    # by a background listener in batches of up to LOG_BATCH_SIZE records.
+    file_handler = logging.FileHandler(args.logfile)
+    file_handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(message)s',
+                                                datefmt='%Y-%m-%d %H:%M:%S'))
+    memory_handler = logging.handlers.MemoryHandler(LOG_BATCH_SIZE, flushLevel=logging.ERROR,
+                                                    target=file_handler)
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, memory_handler)
+    logging.basicConfig(handlers=[logging.handlers.QueueHandler(log_queue)],
+                        format='%(message)s',
                         level=logging.INFO)
-    
+    listener.start()
+
+    # Watch the source, so that later runs only visit changed folders.
+    changes = None
+    if args.watch:
+        changes = ChangedDirectories(args.source)
+        observer = Observer()
+        observer.schedule(changes, args.source, recursive=True)
+        observer.daemon = True
+        observer.start()
+
     # Run synchronization and wait defined time to next synchronization.
-    while True:
-        sync.sync()
-        time.sleep(args.interval)
+    try:
+        next_full_sync = time.monotonic()
+        while True:
+            if changes is None:
+                sync.sync()
+            elif time.monotonic() >= next_full_sync:
+                # A full run covers all pending changes; if it fails, it is retried next time.
+                changes.drain()
+                if sync.sync():
+                    next_full_sync = time.monotonic() + args.full_interval
+            else:
+                changed_dirs = changes.drain()
+                if changed_dirs and not sync.sync(changed_dirs):
+                    # Retry the folders of the failed run on the next one.
+                    changes.add(changed_dirs)
+            # Write out the records of the finished pass before sleeping.
+            listener.stop()
+            memory_handler.flush()
+            listener.start()
+            time.sleep(args.interval)
+    finally:
+        listener.stop()
+        memory_handler.close()
+        file_handler.close()
 
 
 if __name__ == "__main__":
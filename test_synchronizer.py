@@ -0,0 +1,354 @@
+import os
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+import synchronizer
+from synchronizer import ChangedDirectories, Synchronizer
+
+
+def make_tree(root, files):
+    """Creates files with the given contents, {relative path: bytes}, below root."""
+    for path, content in files.items():
+        full_path = root / path
+        full_path.parent.mkdir(parents=True, exist_ok=True)
+        full_path.write_bytes(content)
+
+
+def read_tree(root):
+    """Returns {relative path: bytes} for all files below root."""
+    return {
+        os.path.relpath(os.path.join(dirpath, file), root).replace(os.sep, "/"):
+            Path(dirpath, file).read_bytes()
+        for dirpath, _, files in os.walk(root)
+        for file in files
+    }
+
+
+def cached_paths(sync):
+    """Returns the replica paths with a cached checksum, in memory and in the database."""
+    rows = sync.cache_db.execute("SELECT path FROM checksums").fetchall()
+    return set(sync.checksum_cache), {path for path, in rows}
+
+
+@pytest.fixture
+def dirs(tmp_path):
+    source = tmp_path / "source"
+    replica = tmp_path / "replica"
+    source.mkdir()
+    return source, replica, tmp_path / "sync.log"
+
+
+@pytest.fixture
+def sync(dirs):
+    source, replica, logfile = dirs
+    return Synchronizer(str(source), str(replica), str(logfile), 1)
+
+
+def touch(path, ns):
+    os.utime(path, ns=(ns, ns))
+
+
+def test_full_sync_copies_tree(dirs, sync):
+    source, replica, _ = dirs
+    make_tree(source, {"a.txt": b"a", "sub/b.txt": b"bb", "sub/deep/c.bin": os.urandom(3 << 20)})
+    (replica / "stale").mkdir(parents=True)
+    (replica / "stale" / "x").write_bytes(b"x")
+    (replica / "junk.txt").write_bytes(b"junk")
+
+    sync.sync()
+
+    assert read_tree(replica) == read_tree(source)
+    assert os.stat(replica / "sub" / "b.txt").st_mtime_ns == os.stat(source / "sub" / "b.txt").st_mtime_ns
+
+
+def test_updates_changed_files(dirs, sync):
+    source, replica, _ = dirs
+    make_tree(source, {"same_size.txt": b"hello", "grown.txt": b"a"})
+    sync.sync()
+
+    (source / "same_size.txt").write_bytes(b"world")
+    touch(source / "same_size.txt", 10**9)
+    (source / "grown.txt").write_bytes(b"abc")
+    sync.sync()
+
+    assert read_tree(replica) == read_tree(source)
+
+
+@pytest.mark.parametrize("deleted", ["sub", "sub/nested"])
+def test_deleted_directory_drops_cache_rows(dirs, sync, deleted):
+    source, replica, _ = dirs
+    make_tree(source, {"top.txt": b"t", "sub/a.txt": b"a", "sub/nested/b.txt": b"b"})
+    sync.sync()
+    # A second pass with new mtimes hashes the files and caches their checksums.
+    for path in ("top.txt", "sub/a.txt", "sub/nested/b.txt"):
+        touch(source / path, 10**9)
+    sync.sync()
+    assert len(cached_paths(sync)[1]) == 3
+
+    for dirpath, _, files in os.walk(source / deleted, topdown=False):
+        for file in files:
+            os.remove(os.path.join(dirpath, file))
+        os.rmdir(dirpath)
+    sync.sync()
+
+    assert read_tree(replica) == read_tree(source)
+    prefix = os.path.join(str(replica), deleted, "")
+    for paths in cached_paths(sync):
+        assert paths
+        assert not [path for path in paths if path.startswith(prefix)]
+
+
+def test_matching_size_and_mtime_skips_reading(dirs, sync, monkeypatch):
+    source, replica, _ = dirs
+    make_tree(source, {"a.txt": b"abc"})
+    sync.sync()
+
+    def fail(*args):
+        raise AssertionError("file content was read")
+
+    monkeypatch.setattr(sync, "get_checksum", fail)
+    monkeypatch.setattr(sync, "compare_files", fail)
+    # Same size and mtime count as unchanged, even with different content.
+    (source / "a.txt").write_bytes(b"xyz")
+    touch(source / "a.txt", os.stat(replica / "a.txt").st_mtime_ns)
+    sync.sync()
+
+    assert (replica / "a.txt").read_bytes() == b"abc"
+
+
+def test_size_mismatch_skips_reading(dirs, sync, monkeypatch):
+    source, replica, _ = dirs
+    make_tree(source, {"b.txt": b"abc"})
+    sync.sync()
+
+    def fail(*args):
+        raise AssertionError("file content was read")
+
+    monkeypatch.setattr(sync, "get_checksum", fail)
+    monkeypatch.setattr(sync, "compare_files", fail)
+    # A different size is a change without reading the files.
+    (source / "b.txt").write_bytes(b"abcd")
+    sync.sync()
+
+    assert (replica / "b.txt").read_bytes() == b"abcd"
+
+
+def test_cached_replica_checksum_is_reused(dirs, sync, monkeypatch):
+    source, replica, logfile = dirs
+    make_tree(source, {"a.txt": b"abc"})
+    sync.sync()
+    touch(source / "a.txt", 10**9)
+    sync.sync()
+
+    reloaded = Synchronizer(str(source), str(replica), str(logfile), 1)
+    hashed = []
+    get_checksum = reloaded.get_checksum
+    monkeypatch.setattr(reloaded, "get_checksum", lambda path: hashed.append(path) or get_checksum(path))
+    touch(source / "a.txt", 2 * 10**9)
+    reloaded.sync()
+
+    assert hashed == [str(source / "a.txt")]
+    assert (replica / "a.txt").read_bytes() == b"abc"
+
+
+def directory_event(path, event_type="modified"):
+    return SimpleNamespace(event_type=event_type, src_path=str(path), dest_path="", is_directory=True)
+
+
+def test_root_directory_event_stays_inside_source(dirs, sync):
+    source, replica, _ = dirs
+    make_tree(source, {"a.txt": b"a"})
+    sync.sync()
+    sentinel = replica.parent / "sentinel"
+    sentinel.write_bytes(b"keep")
+    make_tree(source, {"b.txt": b"b"})
+
+    changes = ChangedDirectories(str(source))
+    changes.dispatch(directory_event(source))
+    changes.dispatch(directory_event(source.parent))
+    changed_dirs = changes.drain()
+    assert changed_dirs == {str(source)}
+    sync.sync(changed_dirs)
+
+    assert read_tree(replica) == read_tree(source)
+    assert sentinel.read_bytes() == b"keep"
+
+
+def test_changed_dirs_outside_source_are_skipped(dirs, sync):
+    source, replica, _ = dirs
+    make_tree(source, {"a.txt": b"a"})
+    sync.sync()
+    (replica.parent / "sentinel").write_bytes(b"keep")
+
+    sync.sync({str(source.parent)})
+
+    assert (replica.parent / "sentinel").read_bytes() == b"keep"
+    assert read_tree(replica) == read_tree(source)
+
+
+def test_new_directory_is_walked_once(dirs, sync, monkeypatch):
+    source, replica, _ = dirs
+    make_tree(source, {"a.txt": b"a"})
+    sync.sync()
+    make_tree(source, {"new/f.txt": b"f", "new/sub/g.txt": b"g"})
+
+    changes = ChangedDirectories(str(source))
+    changes.dispatch(directory_event(source / "new", "created"))
+    changes.dispatch(directory_event(source / "new" / "sub", "created"))
+    changed_dirs = changes.drain()
+    assert changed_dirs == {str(source), str(source / "new"), str(source / "new" / "sub")}
+
+    roots = [root for root, _, _ in sync.walk_changed(changed_dirs)]
+    assert sorted(roots) == sorted(set(roots))
+
+    updated = []
+    monkeypatch.setattr(sync, "update_changed_file", lambda *args: updated.append(args))
+    sync.sync(changed_dirs)
+
+    assert updated == []
+    assert read_tree(replica) == read_tree(source)
+
+
+def test_failed_sync_keeps_changed_dirs(dirs, sync):
+    source, replica, _ = dirs
+    make_tree(source, {"a.txt": b"a"})
+    assert sync.sync()
+    changes = ChangedDirectories(str(source))
+    changes.dispatch(directory_event(source / "new", "created"))
+    make_tree(source, {"new/f.txt": b"f"})
+    (replica / "new").write_bytes(b"not a directory")
+
+    changed_dirs = changes.drain()
+    assert not sync.sync(changed_dirs)
+    changes.add(changed_dirs)
+
+    assert changes.drain() == {str(source), str(source / "new")}
+
+
+def fail_with_oserror(*args):
+    raise OSError(95, "Operation not supported")
+
+
+@pytest.mark.parametrize("copy_file_range", [
+    lambda *args: 0,
+    fail_with_oserror,
+])
+def test_copy_file_falls_back_to_copyfile(dirs, sync, monkeypatch, copy_file_range):
+    source, replica, _ = dirs
+    content = os.urandom(3 << 20)
+    make_tree(source, {"big.bin": content})
+    replica.mkdir()
+    monkeypatch.setattr(sync, "clone_file", fail_with_oserror)
+    monkeypatch.setattr(os, "copy_file_range", copy_file_range, raising=False)
+
+    sync.copy_file(str(source / "big.bin"), str(replica / "big.bin"))
+
+    assert (replica / "big.bin").read_bytes() == content
+    assert os.stat(replica / "big.bin").st_mtime_ns == os.stat(source / "big.bin").st_mtime_ns
+
+
+def test_copy_file_without_fast_paths(dirs, sync, monkeypatch):
+    source, replica, _ = dirs
+    make_tree(source, {"a.txt": b"abc"})
+    replica.mkdir()
+    monkeypatch.setattr(sync, "clone_file", fail_with_oserror)
+    monkeypatch.delattr(os, "copy_file_range", raising=False)
+
+    sync.copy_file(str(source / "a.txt"), str(replica / "a.txt"))
+
+    assert (replica / "a.txt").read_bytes() == b"abc"
+
+
+def test_unreadable_changed_dir_fails_sync(dirs, sync, monkeypatch):
+    source, replica, _ = dirs
+    make_tree(source, {"a.txt": b"a", "sub/b.txt": b"b"})
+    assert sync.sync()
+    make_tree(source, {"sub/new.txt": b"n"})
+    scandir = os.scandir
+
+    def deny_sub(path):
+        if os.path.normpath(path) == str(source / "sub"):
+            raise PermissionError(13, "Permission denied", path)
+        return scandir(path)
+
+    monkeypatch.setattr(os, "scandir", deny_sub)
+    assert not sync.sync({str(source / "sub")})
+    assert not sync.sync()
+
+    monkeypatch.setattr(os, "scandir", scandir)
+    assert sync.sync({str(source / "sub")})
+    assert read_tree(replica) == read_tree(source)
+
+
+def test_source_changed_before_copy_is_not_cached(dirs, sync):
+    source, replica, _ = dirs
+    make_tree(source, {"a.txt": b"old"})
+    sync.sync()
+    touch(source / "a.txt", 10**9)
+    sync.sync()
+    (source / "a.txt").write_bytes(b"new")
+    touch(source / "a.txt", 2 * 10**9)
+    source_file, replica_file = str(source / "a.txt"), str(replica / "a.txt")
+
+    changed, source_entry = sync.check_changed_file(source_file, replica_file)
+    assert changed
+    # The source changes again between the check and the copy.
+    (source / "a.txt").write_bytes(b"xyz")
+    touch(source / "a.txt", 3 * 10**9)
+    sync.update_changed_file(source_file, replica_file, source_entry)
+
+    assert (replica / "a.txt").read_bytes() == b"xyz"
+    assert replica_file not in sync.checksum_cache
+    # Changing the source back to the hashed content is still replicated.
+    (source / "a.txt").write_bytes(b"new")
+    touch(source / "a.txt", 4 * 10**9)
+    assert sync.sync()
+    assert (replica / "a.txt").read_bytes() == b"new"
+
+
+def test_compare_files_stops_at_first_difference(dirs, sync, monkeypatch):
+    source, replica, _ = dirs
+    content = os.urandom(4 * synchronizer.CHUNK_SIZE)
+    make_tree(source, {"same.bin": content, "differs.bin": content})
+    make_tree(replica, {"same.bin": content, "differs.bin": b"x" + content[1:]})
+    read_sizes = []
+
+    def counting_open(*args, **kwargs):
+        f = open(*args, **kwargs)
+        read = f.read
+        f.read = lambda size: read_sizes.append(size) or read(size)
+        return f
+
+    checksum = sync.get_checksum(str(source / "same.bin"))
+    assert sync.compare_files(str(source / "same.bin"), str(replica / "same.bin")) == checksum
+    monkeypatch.setattr(synchronizer, "open", counting_open, raising=False)
+    assert sync.compare_files(str(source / "differs.bin"), str(replica / "differs.bin")) is None
+    # One chunk of each file is read, not the whole files.
+    assert read_sizes == [synchronizer.CHUNK_SIZE] * 2
+
+
+@pytest.mark.parametrize("algorithm, module", [("blake3", "blake3"), ("xxh3", "xxhash")])
+def test_fast_algorithms(dirs, algorithm, module):
+    pytest.importorskip(module)
+    source, replica, logfile = dirs
+    make_tree(source, {"a.txt": b"abc", "big.bin": os.urandom(3 * synchronizer.CHUNK_SIZE)})
+    sync = Synchronizer(str(source), str(replica), str(logfile), 1, algorithm)
+    sync.sync()
+    touch(source / "big.bin", 10**9)
+    sync.sync()
+
+    content = (source / "big.bin").read_bytes()
+    expected = synchronizer.FAST_ALGORITHMS[algorithm](content).hexdigest()
+    assert sync.get_checksum(str(source / "big.bin")) == expected
+    assert sync.checksum_cache[str(replica / "big.bin")][2] == expected
+    assert read_tree(replica) == read_tree(source)
+
+
+def test_missing_fast_algorithm_is_rejected(dirs, monkeypatch):
+    source, replica, logfile = dirs
+    monkeypatch.setitem(synchronizer.FAST_ALGORITHMS, "blake3", None)
+
+    with pytest.raises(ValueError):
+        Synchronizer(str(source), str(replica), str(logfile), 1, "blake3")